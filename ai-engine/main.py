@@ -1,12 +1,18 @@
-from typing import Tuple
+from typing import Deque, Dict, List, Optional, Tuple
+from collections import OrderedDict, defaultdict, deque
 from fastapi import FastAPI, HTTPException, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from groq import Groq
 import os
 from dotenv import load_dotenv
+import asyncio
+import hashlib
+import json
 import re
 import tempfile
+import threading
 
 load_dotenv()
 
@@ -24,8 +30,27 @@ app.add_middleware(
 # Configure Groq client
 client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
+# Adaptive max_tokens sizing (set ADAPTIVE_MAX_TOKENS to false/0/no/off to always use the defaults)
+ADAPTIVE_MAX_TOKENS = os.getenv("ADAPTIVE_MAX_TOKENS", "true").strip().lower() not in ("false", "0", "no", "off")
+
+# Prompt size budgets per endpoint - a warning is logged when a prompt exceeds these
+PROMPT_TOKEN_BUDGETS = {
+    "analyze": 600,
+    "chat": 1500,
+    "analyze-with-image": 1200,
+    "analyze-with-image:vision": 2500,
+    "analyze-with-image:fallback": 1200,
+    "queue-summary": 500,
+}
+
+# Doctor queue summaries - parallel Groq calls per request and cached case analyses
+QUEUE_SUMMARY_CONCURRENCY = int(os.getenv("QUEUE_SUMMARY_CONCURRENCY", 4))
+QUEUE_SUMMARY_CACHE_SIZE = int(os.getenv("QUEUE_SUMMARY_CACHE_SIZE", 500))
+QUEUE_SUMMARY_MAX_CASES = int(os.getenv("QUEUE_SUMMARY_MAX_CASES", 50))
+
 class AnalysisRequest(BaseModel):
     text: str
+    stream: bool = False
 
 class AnalysisResponse(BaseModel):
     severity: str
@@ -67,6 +92,30 @@ class ImageAnalysisResponse(BaseModel):
     possible_conditions: list = []
     symptoms: list = []
 
+class QueueCase(BaseModel):
+    patient_id: str
+    symptoms: list
+    duration: str = ""
+    history: list = []
+
+class QueueSummaryRequest(BaseModel):
+    cases: List[QueueCase]
+
+class QueueSummary(BaseModel):
+    patient_id: str
+    severity: str
+    score: int
+    urgency_level: str
+    summary: str
+    cached: bool = False
+    assessed: bool = True
+
+class QueueSummaryResponse(BaseModel):
+    summaries: List[QueueSummary]
+    recomputed: int
+    cached: int
+    failed: int
+
 def detect_language(text: str) -> str:
     """Detect language based on Unicode ranges"""
     # Tamil: U+0B80 to U+0BFF
@@ -79,12 +128,15 @@ def detect_language(text: str) -> str:
     else:
         return 'en'
 
+# Keywords that make extract_severity_score rate a response HIGH
+SEVERITY_HIGH_KEYWORDS = ['emergency', 'critical', 'severe', 'urgent', 'immediate']
+
 def extract_severity_score(text: str) -> Tuple[str, int]:
     """Extract severity and score from AI response"""
     text_lower = text.lower()
     
     # Check for severity keywords
-    if any(word in text_lower for word in ['emergency', 'critical', 'severe', 'urgent', 'immediate']):
+    if any(word in text_lower for word in SEVERITY_HIGH_KEYWORDS):
         severity = 'HIGH'
         score = 8
     elif any(word in text_lower for word in ['moderate', 'concerning', 'attention']):
@@ -109,6 +161,160 @@ def extract_severity_score(text: str) -> Tuple[str, int]:
     
     return severity, score
 
+class TokenBudget:
+    """Track observed token usage per endpoint and model, and size max_tokens from it.
+
+    The hard-coded limit of each call is kept as the ceiling. Once enough samples
+    are collected, max_tokens is set to a rolling percentile of the completion
+    lengths plus a safety margin, so the long tail stops driving latency. It never
+    drops below floor_fraction of the ceiling.
+    """
+
+    def __init__(self, window: int = 200, percentile: float = 0.99,
+                 margin: float = 1.25, min_samples: int = 20, floor_fraction: float = 0.25):
+        self.window = window
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.floor_fraction = floor_fraction
+        self._prompt: Dict[Tuple[str, str], Deque[int]] = defaultdict(lambda: deque(maxlen=self.window))
+        # Observed completion lengths, as reported by Groq
+        self._completion: Dict[Tuple[str, str], Deque[int]] = defaultdict(lambda: deque(maxlen=self.window))
+        # Same samples used for sizing, with truncated completions counted as twice the limit
+        self._sizing: Dict[Tuple[str, str], Deque[int]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._truncated: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._limit: Dict[Tuple[str, str], int] = {}
+        self._default: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _rank(values: list, percentile: float) -> int:
+        """Nearest-rank percentile of a list of token counts"""
+        ordered = sorted(values)
+        index = max(0, min(len(ordered) - 1, int(round(percentile * len(ordered))) - 1))
+        return ordered[index]
+
+    def max_tokens(self, endpoint: str, model: str, default: int) -> int:
+        """Return the max_tokens to request, never above the endpoint default"""
+        with self._lock:
+            self._default[(endpoint, model)] = default
+            samples = list(self._sizing[(endpoint, model)])
+        if not ADAPTIVE_MAX_TOKENS:
+            return default
+        if len(samples) < self.min_samples:
+            return default
+        adaptive = int(self._rank(samples, self.percentile) * self.margin)
+        return max(int(default * self.floor_fraction), min(default, adaptive))
+
+    def record(self, endpoint: str, model: str, completion, limit: int) -> None:
+        """Record the usage reported by a Groq chat completion"""
+        usage = getattr(completion, "usage", None)
+        if usage is None:
+            return
+        self.record_usage(endpoint, model, usage, completion_finish_reason(completion), limit)
+
+    def track_stream(self, endpoint: str, model: str, stream, limit: int):
+        """Pass streamed chunks through and record the usage sent with the last one"""
+        usage = None
+        finish_reason = None
+        for chunk in stream:
+            # Groq reports streaming usage under x_groq on the final chunk
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].finish_reason:
+                finish_reason = chunk.choices[0].finish_reason
+            yield chunk
+        if usage is not None:
+            self.record_usage(endpoint, model, usage, finish_reason, limit)
+
+    def record_usage(self, endpoint: str, model: str, usage, finish_reason: Optional[str], limit: int) -> None:
+        """Store one call's prompt and completion token counts"""
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+
+        # A truncated answer says nothing about the real length - count it as twice
+        # the limit so the percentile grows back instead of locking in the cut-off
+        truncated = finish_reason == "length"
+
+        key = (endpoint, model)
+        with self._lock:
+            self._prompt[key].append(prompt_tokens)
+            self._completion[key].append(completion_tokens)
+            self._sizing[key].append(limit * 2 if truncated else completion_tokens)
+            self._limit[key] = limit
+            if truncated:
+                self._truncated[key] += 1
+
+        if truncated:
+            print(f"Completion truncated at {limit} tokens for {endpoint} ({model})")
+
+        prompt_budget = PROMPT_TOKEN_BUDGETS.get(endpoint)
+        if prompt_budget and prompt_tokens > prompt_budget:
+            print(f"Warning: prompt for {endpoint} ({model}) used {prompt_tokens} tokens, budget is {prompt_budget}")
+
+    def snapshot(self) -> dict:
+        """Summarise the recorded usage for each endpoint and model"""
+        with self._lock:
+            keys = list(self._completion.keys())
+            data = {
+                key: (
+                    list(self._prompt[key]), list(self._completion[key]), self._truncated[key],
+                    self._limit.get(key), self._default.get(key)
+                )
+                for key in keys
+            }
+
+        stats = {}
+        for (endpoint, model), (prompts, completions, truncated, limit, default) in data.items():
+            if not completions:
+                continue
+            stats[f"{endpoint}:{model}"] = {
+                "samples": len(completions),
+                "truncated": truncated,
+                "max_tokens": self.max_tokens(endpoint, model, default) if default else None,
+                "last_max_tokens": limit,
+                "prompt_p50": self._rank(prompts, 0.5),
+                "prompt_p99": self._rank(prompts, 0.99),
+                "prompt_budget": PROMPT_TOKEN_BUDGETS.get(endpoint),
+                "completion_p50": self._rank(completions, 0.5),
+                "completion_p99": self._rank(completions, self.percentile),
+            }
+        return stats
+
+token_budget = TokenBudget()
+
+def completion_finish_reason(chat_completion) -> Optional[str]:
+    """Return why a Groq chat completion stopped ("stop", "length", ...)"""
+    if not chat_completion.choices:
+        return None
+    return getattr(chat_completion.choices[0], "finish_reason", None)
+
+def create_chat_completion(endpoint: str, model: str, default_max_tokens: int, **kwargs):
+    """Call Groq chat completions with an adaptive max_tokens and record the usage.
+
+    A non-streaming answer cut off by a reduced limit is retried once at the
+    endpoint default. Streams cannot be retried; stream_analysis flags them instead.
+    """
+    limit = token_budget.max_tokens(endpoint, model, default_max_tokens)
+    chat_completion = client.chat.completions.create(
+        model=model,
+        max_tokens=limit,
+        **kwargs
+    )
+    if kwargs.get("stream"):
+        return token_budget.track_stream(endpoint, model, chat_completion, limit)
+    token_budget.record(endpoint, model, chat_completion, limit)
+
+    if limit < default_max_tokens and completion_finish_reason(chat_completion) == "length":
+        print(f"Retrying {endpoint} ({model}) at {default_max_tokens} tokens after truncation at {limit}")
+        chat_completion = client.chat.completions.create(
+            model=model,
+            max_tokens=default_max_tokens,
+            **kwargs
+        )
+        token_budget.record(endpoint, model, chat_completion, default_max_tokens)
+    return chat_completion
+
 @app.get("/")
 async def root():
     return {"status": "ZYCARE AI Engine Running", "model": "Llama 3.3 70B"}
@@ -120,17 +326,24 @@ async def health_check():
         "groq_configured": bool(os.getenv("GROQ_API_KEY"))
     }
 
-@app.post("/analyze", response_model=AnalysisResponse)
-async def analyze_symptoms(request: AnalysisRequest):
-    try:
-        prompt = f"""You are an AI medical triage assistant for rural healthcare in India.
+@app.get("/token-usage")
+async def token_usage():
+    """Observed prompt/completion token usage, and the max_tokens the next call would use, per endpoint"""
+    return {
+        "adaptive": ADAPTIVE_MAX_TOKENS,
+        "usage": token_budget.snapshot()
+    }
+
+def build_analysis_messages(text: str) -> list:
+    """Build the Groq messages for a text-only triage of the patient's symptoms"""
+    prompt = f"""You are an AI medical triage assistant for rural healthcare in India.
 Analyze the following patient symptoms and provide:
 1. A severity assessment (LOW, MEDIUM, or HIGH)
 2. A severity score from 1-10
 3. A brief summary of the condition
 4. Recommended action for the patient
 
-Patient symptoms: {request.text}
+Patient symptoms: {text}
 
 Format your response as:
 Severity: [LOW/MEDIUM/HIGH]
@@ -140,21 +353,466 @@ Recommended Action: [What the patient should do]
 
 Be concise and clear. Focus on practical advice for rural settings."""
 
+    return [
+        {
+            "role": "system",
+            "content": "You are a compassionate AI medical triage assistant helping rural healthcare workers in India."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+def extract_analysis_sections(ai_text: str) -> Tuple[str, str]:
+    """Extract the summary and recommended action lines from a triage response"""
+    lines = ai_text.split('\n')
+    summary = ""
+    recommended_action = ""
+    
+    capture_summary = False
+    capture_action = False
+    
+    for line in lines:
+        line_lower = line.lower()
+        if 'summary:' in line_lower:
+            summary = line.split(':', 1)[1].strip()
+            capture_summary = True
+            capture_action = False
+        elif 'recommended action:' in line_lower or 'action:' in line_lower:
+            recommended_action = line.split(':', 1)[1].strip()
+            capture_action = True
+            capture_summary = False
+        elif capture_summary and line.strip():
+            summary += " " + line.strip()
+        elif capture_action and line.strip():
+            recommended_action += " " + line.strip()
+    
+    return summary, recommended_action
+
+def parse_analysis(ai_text: str) -> AnalysisResponse:
+    """Turn a complete triage response into an AnalysisResponse"""
+    # Extract severity and score
+    severity, score = extract_severity_score(ai_text)
+    
+    # Extract sections
+    summary, recommended_action = extract_analysis_sections(ai_text)
+    
+    # Fallback if extraction failed
+    if not summary:
+        summary = ai_text[:200] + "..." if len(ai_text) > 200 else ai_text
+    if not recommended_action:
+        if severity == 'HIGH':
+            recommended_action = "Seek immediate medical attention."
+        elif severity == 'MEDIUM':
+            recommended_action = "Consult with a doctor within 24 hours."
+        else:
+            recommended_action = "Monitor symptoms and rest. Seek care if symptoms worsen."
+    
+    return AnalysisResponse(
+        severity=severity,
+        score=score,
+        summary=summary,
+        recommended_action=recommended_action
+    )
+
+# Phrases that mark an image/detailed analysis as needing urgent care
+URGENCY_HIGH_KEYWORDS = ['emergency', 'immediate medical attention', 'urgent care', 'critical', 'life-threatening']
+
+SPECIALIST_MAPPING = {
+    'cardiol': 'Cardiologist',
+    'dermato': 'Dermatologist',
+    'pediatr': 'Pediatrician',
+    'orthoped': 'Orthopedic Surgeon',
+    'psychiat': 'Psychiatrist',
+    'neurolog': 'Neurologist',
+    'gynecolog': 'Gynecologist',
+    'urolog': 'Urologist',
+    'general physician': 'General Physician',
+    'ent': 'ENT Specialist',
+    'gastro': 'Gastroenterologist',
+    'pulmonologist': 'Pulmonologist',
+    'ophthalmologist': 'Ophthalmologist',
+    'endocrinologist': 'Endocrinologist',
+    'rheumatologist': 'Rheumatologist',
+    'emergency': 'Emergency Medicine',
+    'primary care': 'General Physician'
+}
+
+def extract_image_findings(sections: list) -> str:
+    """Extract the first meaningful paragraph about the image"""
+    image_findings = ""
+    for section in sections:
+        section_lower = section.lower()
+        if any(keyword in section_lower for keyword in ['visual finding', 'image analysis', 'visible', 'observed in image', 'clinical image']):
+            lines = [line.strip() for line in section.split('\n') if line.strip() and not line.strip().startswith(('*', '-', '#'))]
+            if lines:
+                image_findings = ' '.join(lines[:3])  # First 3 relevant lines
+            break
+    return image_findings
+
+def extract_urgency(response_lower: str) -> Tuple[str, str]:
+    """Return (urgency_level, severity) from the urgency phrases in the response"""
+    if any(word in response_lower for word in URGENCY_HIGH_KEYWORDS):
+        return "high", "HIGH"
+    elif any(word in response_lower for word in ['moderate', 'medical attention soon', 'concerning', 'should see doctor', 'medium severity']):
+        return "medium", "MEDIUM"
+    else:
+        return "low", "LOW"
+
+def extract_diagnosis(sections: list) -> str:
+    """Extract the main diagnosis text from the diagnosis section"""
+    for section in sections:
+        section_lower = section.lower()
+        if any(keyword in section_lower for keyword in ['differential diagnosis', 'likely condition', 'diagnosis:', 'clinical impression']):
+            lines = [line.strip() for line in section.split('\n') if line.strip()]
+            return ' '.join(lines[:5])  # First 5 lines of diagnosis section
+    return ""
+
+def extract_recommendations(sections: list) -> list:
+    """Extract actionable recommendations from the management section"""
+    recommendations = []
+    for section in sections:
+        section_lower = section.lower()
+        if any(keyword in section_lower for keyword in ['recommendation', 'management', 'advice', 'should do', 'action']):
+            lines = section.split('\n')
+            for line in lines:
+                line_clean = line.strip('- •*#1234567890. ').strip()
+                if line_clean and len(line_clean) > 15:  # Meaningful recommendation
+                    if any(action in line_clean.lower() for action in ['consult', 'see', 'visit', 'avoid', 'take', 'apply', 'monitor', 'seek', 'rest', 'drink']):
+                        recommendations.append(line_clean)
+                        if len(recommendations) >= 5:
+                            break
+            break
+    return recommendations
+
+def extract_specialists(response_lower: str) -> list:
+    """Map specialty keywords mentioned in the response to specialist names"""
+    suggested_specialists = []
+    for keyword, specialist_name in SPECIALIST_MAPPING.items():
+        if keyword in response_lower and specialist_name not in suggested_specialists:
+            suggested_specialists.append(specialist_name)
+    return suggested_specialists
+
+def parse_image_analysis(ai_response_str: str, symptoms_list: list, duration: str) -> ImageAnalysisResponse:
+    """Parse a complete detailed analysis into an ImageAnalysisResponse"""
+    # Split response into sections for better parsing
+    sections = ai_response_str.split('\n\n')
+    response_lower = ai_response_str.lower()
+    
+    # Extract image findings (improved detection)
+    image_findings = extract_image_findings(sections)
+    
+    # Extract severity/urgency with more precise detection
+    urgency_level, severity = extract_urgency(response_lower)
+    
+    # Extract diagnosis with better parsing
+    diagnosis = extract_diagnosis(sections)
+    
+    if not diagnosis:
+        # Fallback: take first meaningful paragraph
+        for section in sections:
+            if len(section) > 50:
+                diagnosis = section[:300]
+                break
+    
+    # Extract recommendations with improved parsing
+    recommendations = extract_recommendations(sections)
+    
+    if not recommendations:
+        # Default recommendations based on severity
+        if severity == "HIGH":
+            recommendations = [
+                "Seek immediate medical attention at the nearest healthcare facility",
+                "Do not delay - this requires urgent evaluation",
+                "Call emergency services if symptoms worsen suddenly"
+            ]
+        elif severity == "MEDIUM":
+            recommendations = [
+                "Consult with a healthcare professional within 24-48 hours",
+                "Monitor symptoms closely and note any changes",
+                "Avoid self-medication without medical advice"
+            ]
+        else:
+            recommendations = [
+                "Monitor symptoms - consult doctor if they persist or worsen",
+                "Maintain proper hygiene and rest",
+                "Stay hydrated and follow basic self-care measures"
+            ]
+    
+    # Extract specialists with improved detection
+    suggested_specialists = extract_specialists(response_lower)
+    
+    # If no specialists found, infer from severity
+    if not suggested_specialists:
+        if severity == "HIGH":
+            suggested_specialists = ["Emergency Medicine", "General Physician"]
+        else:
+            suggested_specialists = ["General Physician"]
+    
+    # Build possible conditions list with better extraction
+    possible_conditions = []
+    conditions_found = False
+    
+    for section in sections:
+        section_lower = section.lower()
+        if any(keyword in section_lower for keyword in ['differential diagnosis', 'possible condition', 'likely diagnos']):
+            lines = [line.strip() for line in section.split('\n') if line.strip()]
+            for line in lines:
+                # Look for numbered or bulleted lists
+                if any(char in line[:5] for char in ['1', '2', '3', '•', '-', '*']):
+                    condition_text = line.strip('1234567890.-•* ').strip()
+                    if len(condition_text) > 10:  # Meaningful condition
+                        # Try to extract probability if mentioned
+                        probability = 70  # Default
+                        if 'high' in line.lower() or 'likely' in line.lower():
+                            probability = 80
+                        elif 'possible' in line.lower() or 'consider' in line.lower():
+                            probability = 60
+                        elif 'unlikely' in line.lower() or 'less likely' in line.lower():
+                            probability = 40
+                        
+                        possible_conditions.append({
+                            "name": condition_text.split(':')[0].strip() if ':' in condition_text else condition_text[:60],
+                            "probability": probability,
+                            "description": condition_text
+                        })
+                        conditions_found = True
+                        if len(possible_conditions) >= 4:  # Max 4 conditions
+                            break
+            if conditions_found:
+                break
+    
+    # Fallback: extract from diagnosis text
+    if not possible_conditions and diagnosis:
+        condition_lines = [line.strip() for line in diagnosis.split('.') if line.strip()]
+        for i, line in enumerate(condition_lines[:3]):
+            if len(line) > 15:
+                possible_conditions.append({
+                    "name": line[:50],
+                    "probability": 75 - (i * 15),
+                    "description": line
+                })
+    
+    # Ensure at least one condition
+    if not possible_conditions:
+        possible_conditions.append({
+            "name": "Requires professional evaluation",
+            "probability": 50,
+            "description": "Symptoms require in-person medical assessment for accurate diagnosis"
+        })
+    
+    # Build symptoms list from input
+    symptoms_obj_list = []
+    for symptom in symptoms_list:
+        symptoms_obj_list.append({
+            "id": symptom.lower().replace(' ', '_'),
+            "name": symptom,
+            "severity": severity.lower(),
+            "duration": duration
+        })
+    
+    return ImageAnalysisResponse(
+        image_findings=image_findings or "No image provided for analysis",
+        severity=severity,
+        diagnosis=diagnosis,
+        recommendations=recommendations[:5],  # Limit to 5
+        suggested_specialists=suggested_specialists[:3],  # Limit to 3
+        urgency_level=urgency_level,
+        possible_conditions=possible_conditions,
+        symptoms=symptoms_obj_list
+    )
+
+class AnalysisStreamParser:
+    """Parse a streamed /analyze response and emit events as soon as they are decided"""
+
+    def __init__(self):
+        self.text = ""
+        self._severity: Optional[Tuple[str, int]] = None
+        self._score_seen = False
+        self._summary_sent = False
+
+    def _severity_event(self, severity: str, score: int) -> List[dict]:
+        if self._severity == (severity, score):
+            return []
+        self._severity = (severity, score)
+        return [{
+            "event": "severity",
+            "data": {"severity": severity, "score": score, "urgency_level": severity.lower(), "provisional": True}
+        }]
+
+    def feed(self, delta: str) -> List[dict]:
+        self.text += delta
+        events = []
+        text_lower = self.text.lower()
+
+        # An emergency keyword already means HIGH unless the score line says otherwise
+        if not self._score_seen and self._severity is None:
+            if any(word in text_lower for word in SEVERITY_HIGH_KEYWORDS):
+                events += self._severity_event('HIGH', 8)
+
+        if '\n' in delta or ':' in delta:
+            events += self._scan(final=False)
+        return events
+
+    def close(self) -> List[dict]:
+        return self._scan(final=True)
+
+    def _scan(self, final: bool) -> List[dict]:
+        events = []
+        # Only whole lines are trusted, so a streamed "Score: 1" is not mistaken for 10
+        complete = self.text if final else self.text[:self.text.rfind('\n') + 1]
+
+        if not self._score_seen:
+            score_match = re.search(r'score[:\s]*(\d+)', complete.lower())
+            if score_match and 1 <= int(score_match.group(1)) <= 10:
+                # The first numeric score fixes extract_severity_score's result
+                self._score_seen = True
+                events += self._severity_event(*extract_severity_score(complete))
+
+        if not self._summary_sent:
+            lines = self.text.split('\n')
+            for index, line in enumerate(lines):
+                line_lower = line.lower()
+                if 'summary:' not in line_lower and ('recommended action:' in line_lower or 'action:' in line_lower):
+                    summary, _ = extract_analysis_sections('\n'.join(lines[:index]))
+                    if summary:
+                        self._summary_sent = True
+                        events.append({"event": "summary", "data": {"summary": summary}})
+                    break
+
+        if final:
+            summary, recommended_action = extract_analysis_sections(self.text)
+            if summary and not self._summary_sent:
+                events.append({"event": "summary", "data": {"summary": summary}})
+            if recommended_action:
+                events.append({"event": "recommended_action", "data": {"recommended_action": recommended_action}})
+        return events
+
+class ImageAnalysisStreamParser:
+    """Parse a streamed /analyze-with-image response and emit each section once it completes"""
+
+    def __init__(self):
+        self.text = ""
+        self._urgency_sent = False
+        self._sent: Dict[str, object] = {}
+
+    def feed(self, delta: str) -> List[dict]:
+        self.text += delta
+        events = []
+
+        # HIGH is the only level that later text cannot change
+        if not self._urgency_sent and any(word in self.text.lower() for word in URGENCY_HIGH_KEYWORDS):
+            self._urgency_sent = True
+            events.append({
+                "event": "severity",
+                "data": {"severity": "HIGH", "urgency_level": "high", "provisional": True}
+            })
+
+        if '\n' in delta:
+            # The last section may still be growing
+            events += self._scan(self.text.split('\n\n')[:-1])
+        return events
+
+    def close(self) -> List[dict]:
+        events = self._scan(self.text.split('\n\n'))
+        # Specialists are matched by keyword over the whole response, so they are
+        # only known once it has finished
+        specialists = extract_specialists(self.text.lower())[:3]
+        if specialists:
+            events.append({"event": "suggested_specialists", "data": {"suggested_specialists": specialists}})
+        return events
+
+    def _scan(self, sections: list) -> List[dict]:
+        # Each extractor uses the first matching section, so once a value is found
+        # in completed sections it is final and sent only once
+        found = {
+            "image_findings": extract_image_findings(sections),
+            "diagnosis": extract_diagnosis(sections),
+            "recommendations": extract_recommendations(sections)[:5],
+        }
+        events = []
+        for name, value in found.items():
+            if value and name not in self._sent:
+                self._sent[name] = value
+                events.append({"event": name, "data": {name: value}})
+        return events
+
+def stream_analysis(chunks, new_parser, parse_response, fallback=None) -> StreamingResponse:
+    """Stream parser events as NDJSON, ending with the validated response object.
+
+    If the stream fails before any event has been sent and a fallback is given,
+    the fallback completion is streamed instead. Once events have reached the
+    client a failure ends the stream with an error event.
+    """
+    truncated = False
+
+    def parse_chunks(stream, parser):
+        nonlocal truncated
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason == "length":
+                truncated = True
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            yield from parser.feed(delta)
+
+    def generate():
+        parser = new_parser()
+        sent = False
+        try:
+            try:
+                for event in parse_chunks(chunks, parser):
+                    sent = True
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+            except Exception as stream_error:
+                if fallback is None or sent:
+                    raise
+                print(f"Streaming error, retrying with fallback model: {str(stream_error)}")
+                parser = new_parser()
+                for event in parse_chunks(fallback(), parser):
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+
+            for event in parser.close():
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+
+            if not parser.text:
+                raise ValueError("No response from AI model")
+
+            result = parse_response(parser.text)
+            # A cut-off stream cannot be retried, so tell the client the result may be incomplete
+            yield json.dumps({"event": "result", "data": result.model_dump(), "truncated": truncated}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"Error in streaming analysis: {str(e)}")
+            yield json.dumps({"event": "error", "data": {"detail": f"Analysis failed: {str(e)}"}}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/analyze", response_model=AnalysisResponse)
+async def analyze_symptoms(request: AnalysisRequest):
+    try:
+        messages = build_analysis_messages(request.text)
+
+        if request.stream:
+            chunks = create_chat_completion(
+                "analyze",
+                "llama-3.3-70b-versatile",
+                1024,
+                messages=messages,
+                temperature=0.7,
+                stream=True,
+            )
+            return stream_analysis(chunks, AnalysisStreamParser, parse_analysis)
+
         # Use Groq API with llama-3.3-70b-versatile
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a compassionate AI medical triage assistant helping rural healthcare workers in India."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            model="llama-3.3-70b-versatile",
+        chat_completion = create_chat_completion(
+            "analyze",
+            "llama-3.3-70b-versatile",
+            1024,
+            messages=messages,
             temperature=0.7,
-            max_tokens=1024,
         )
         
         ai_text = chat_completion.choices[0].message.content
@@ -162,49 +820,7 @@ Be concise and clear. Focus on practical advice for rural settings."""
         if not ai_text:
             raise ValueError("No response from AI model")
         
-        # Extract severity and score
-        severity, score = extract_severity_score(ai_text)
-        
-        # Extract sections
-        lines = ai_text.split('\n')
-        summary = ""
-        recommended_action = ""
-        
-        capture_summary = False
-        capture_action = False
-        
-        for line in lines:
-            line_lower = line.lower()
-            if 'summary:' in line_lower:
-                summary = line.split(':', 1)[1].strip()
-                capture_summary = True
-                capture_action = False
-            elif 'recommended action:' in line_lower or 'action:' in line_lower:
-                recommended_action = line.split(':', 1)[1].strip()
-                capture_action = True
-                capture_summary = False
-            elif capture_summary and line.strip():
-                summary += " " + line.strip()
-            elif capture_action and line.strip():
-                recommended_action += " " + line.strip()
-        
-        # Fallback if extraction failed
-        if not summary:
-            summary = ai_text[:200] + "..." if len(ai_text) > 200 else ai_text
-        if not recommended_action:
-            if severity == 'HIGH':
-                recommended_action = "Seek immediate medical attention."
-            elif severity == 'MEDIUM':
-                recommended_action = "Consult with a doctor within 24 hours."
-            else:
-                recommended_action = "Monitor symptoms and rest. Seek care if symptoms worsen."
-        
-        return AnalysisResponse(
-            severity=severity,
-            score=score,
-            summary=summary,
-            recommended_action=recommended_action
-        )
+        return parse_analysis(ai_text)
     except Exception as e:
         print(f"Error in symptom analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
@@ -261,11 +877,12 @@ Remember: You are a helpful assistant, not a replacement for professional medica
         })
         
         # Call Groq API with llama-3.3-70b-versatile
-        chat_completion = client.chat.completions.create(
+        chat_completion = create_chat_completion(
+            "chat",
+            "llama-3.3-70b-versatile",
+            512,
             messages=messages,  # type: ignore
-            model="llama-3.3-70b-versatile",
             temperature=0.7,
-            max_tokens=512,
         )
         
         reply = chat_completion.choices[0].message.content
@@ -343,7 +960,8 @@ async def analyze_symptoms_with_image(
     file: UploadFile = File(None),
     symptoms: str = Form(""),
     duration: str = Form(""),
-    additional_info: str = Form("")
+    additional_info: str = Form(""),
+    stream: bool = Form(False)
 ):
     """Analyze symptoms with optional medical image using Groq's Llama Vision"""
     try:
@@ -362,6 +980,9 @@ async def analyze_symptoms_with_image(
                 detail="Please provide symptoms for analysis"
             )
         
+        # Streamed vision responses retry with this if they fail before sending anything
+        fallback = None
+        
         # Build comprehensive medical analysis prompt
         prompt = f"""You are Dr. AI, an expert medical diagnostic assistant with extensive training in clinical medicine, pathology, and differential diagnosis. You are analyzing a patient's case for a rural healthcare setting in India.
 
@@ -409,9 +1030,37 @@ Provide a comprehensive medical analysis following this structure:
 
 """
             
+            def create_fallback_completion():
+                # Fallback to text-only analysis with image description
+                prompt_fallback = f"""{prompt}
+
+Note: Image was provided but vision analysis is currently unavailable. 
+Proceeding with text-based symptom analysis only.
+"""
+                return create_chat_completion(
+                    "analyze-with-image:fallback",
+                    "llama-3.3-70b-versatile",
+                    2048,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "You are an expert medical AI assistant specializing in diagnostic analysis for rural healthcare in India."
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt_fallback
+                        }
+                    ],
+                    temperature=0.7,
+                    stream=stream,
+                )
+            
             # Try to use Groq's Llama Vision model with detailed instructions
             try:
-                chat_completion = client.chat.completions.create(
+                chat_completion = create_chat_completion(
+                    "analyze-with-image:vision",
+                    "llama-3.2-11b-vision-preview",
+                    3000,  # More tokens for detailed analysis
                     messages=[
                         {
                             "role": "system",
@@ -430,33 +1079,14 @@ Provide a comprehensive medical analysis following this structure:
                             ]
                         }
                     ],
-                    model="llama-3.2-11b-vision-preview",
                     temperature=0.3,  # Lower temperature for more consistent medical analysis
-                    max_tokens=3000,  # More tokens for detailed analysis
+                    stream=stream,
                 )
+                # A streamed vision response can still fail part way through
+                fallback = create_fallback_completion
             except Exception as vision_error:
                 print(f"Vision model error: {str(vision_error)}")
-                # Fallback to text-only analysis with image description
-                prompt_fallback = f"""{prompt}
-
-Note: Image was provided but vision analysis is currently unavailable. 
-Proceeding with text-based symptom analysis only.
-"""
-                chat_completion = client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are an expert medical AI assistant specializing in diagnostic analysis for rural healthcare in India."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt_fallback
-                        }
-                    ],
-                    model="llama-3.3-70b-versatile",
-                    temperature=0.7,
-                    max_tokens=2048,
-                )
+                chat_completion = create_fallback_completion()
             
             # Clean up temp file
             os.unlink(temp_path)
@@ -497,7 +1127,10 @@ Proceeding with text-based symptom analysis only.
 Provide your analysis in clear, structured format. Be specific and evidence-based. Consider Indian healthcare context.
 """
             
-            chat_completion = client.chat.completions.create(
+            chat_completion = create_chat_completion(
+                "analyze-with-image",
+                "llama-3.3-70b-versatile",
+                3000,  # More tokens for comprehensive analysis
                 messages=[
                     {
                         "role": "system",
@@ -508,9 +1141,16 @@ Provide your analysis in clear, structured format. Be specific and evidence-base
                         "content": prompt
                     }
                 ],
-                model="llama-3.3-70b-versatile",
                 temperature=0.3,  # Lower for more consistent medical advice
-                max_tokens=3000  # More tokens for comprehensive analysis
+                stream=stream,
+            )
+        
+        if stream:
+            return stream_analysis(
+                chat_completion,
+                ImageAnalysisStreamParser,
+                lambda text: parse_image_analysis(text, symptoms_list, duration),
+                fallback=fallback
             )
         
         # Validate AI response
@@ -521,202 +1161,199 @@ Provide your analysis in clear, structured format. Be specific and evidence-base
         # Ensure type safety
         ai_response_str: str = str(ai_response)
         
-        # Parse AI response to extract structured data with improved extraction
-        image_findings = ""
-        diagnosis = ""
-        recommendations = []
-        suggested_specialists = []
-        urgency_level = "medium"
-        severity = "MEDIUM"
-        possible_conditions = []
-        
-        # Split response into sections for better parsing
-        sections = ai_response_str.split('\n\n')
-        response_lower = ai_response_str.lower()
-        
-        # Extract image findings (improved detection)
-        for section in sections:
-            section_lower = section.lower()
-            if any(keyword in section_lower for keyword in ['visual finding', 'image analysis', 'visible', 'observed in image', 'clinical image']):
-                # Extract first meaningful paragraph about image
-                lines = [line.strip() for line in section.split('\n') if line.strip() and not line.strip().startswith(('*', '-', '#'))]
-                if lines:
-                    image_findings = ' '.join(lines[:3])  # First 3 relevant lines
-                break
-        
-        # Extract severity/urgency with more precise detection
-        if any(word in response_lower for word in ['emergency', 'immediate medical attention', 'urgent care', 'critical', 'life-threatening']):
-            urgency_level = "high"
-            severity = "HIGH"
-        elif any(word in response_lower for word in ['moderate', 'medical attention soon', 'concerning', 'should see doctor', 'medium severity']):
-            urgency_level = "medium"
-            severity = "MEDIUM"
-        else:
-            urgency_level = "low"
-            severity = "LOW"
-        
-        # Extract diagnosis with better parsing
-        diagnosis = ""
-        for section in sections:
-            section_lower = section.lower()
-            if any(keyword in section_lower for keyword in ['differential diagnosis', 'likely condition', 'diagnosis:', 'clinical impression']):
-                # Get the main diagnosis text
-                lines = [line.strip() for line in section.split('\n') if line.strip()]
-                diagnosis = ' '.join(lines[:5])  # First 5 lines of diagnosis section
-                break
-        
-        if not diagnosis:
-            # Fallback: take first meaningful paragraph
-            for section in sections:
-                if len(section) > 50:
-                    diagnosis = section[:300]
-                    break
-        
-        # Extract recommendations with improved parsing
-        recommendations = []
-        for section in sections:
-            section_lower = section.lower()
-            if any(keyword in section_lower for keyword in ['recommendation', 'management', 'advice', 'should do', 'action']):
-                lines = section.split('\n')
-                for line in lines:
-                    line_clean = line.strip('- •*#1234567890. ').strip()
-                    if line_clean and len(line_clean) > 15:  # Meaningful recommendation
-                        if any(action in line_clean.lower() for action in ['consult', 'see', 'visit', 'avoid', 'take', 'apply', 'monitor', 'seek', 'rest', 'drink']):
-                            recommendations.append(line_clean)
-                            if len(recommendations) >= 5:
-                                break
-                break
+        return parse_image_analysis(ai_response_str, symptoms_list, duration)
         
-        if not recommendations:
-            # Default recommendations based on severity
-            if severity == "HIGH":
-                recommendations = [
-                    "Seek immediate medical attention at the nearest healthcare facility",
-                    "Do not delay - this requires urgent evaluation",
-                    "Call emergency services if symptoms worsen suddenly"
-                ]
-            elif severity == "MEDIUM":
-                recommendations = [
-                    "Consult with a healthcare professional within 24-48 hours",
-                    "Monitor symptoms closely and note any changes",
-                    "Avoid self-medication without medical advice"
-                ]
-            else:
-                recommendations = [
-                    "Monitor symptoms - consult doctor if they persist or worsen",
-                    "Maintain proper hygiene and rest",
-                    "Stay hydrated and follow basic self-care measures"
-                ]
-        
-        # Extract specialists with improved detection
-        specialist_mapping = {
-            'cardiol': 'Cardiologist',
-            'dermato': 'Dermatologist',
-            'pediatr': 'Pediatrician',
-            'orthoped': 'Orthopedic Surgeon',
-            'psychiat': 'Psychiatrist',
-            'neurolog': 'Neurologist',
-            'gynecolog': 'Gynecologist',
-            'urolog': 'Urologist',
-            'general physician': 'General Physician',
-            'ent': 'ENT Specialist',
-            'gastro': 'Gastroenterologist',
-            'pulmonologist': 'Pulmonologist',
-            'ophthalmologist': 'Ophthalmologist',
-            'endocrinologist': 'Endocrinologist',
-            'rheumatologist': 'Rheumatologist',
-            'emergency': 'Emergency Medicine',
-            'primary care': 'General Physician'
+    except Exception as e:
+        print(f"Error in image analysis: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+# Summaries keyed by case fingerprint, least recently used evicted first
+queue_summary_cache: "OrderedDict[str, QueueSummary]" = OrderedDict()
+
+# Shared by all requests so overlapping queue refreshes stay within the Groq concurrency limit
+queue_summary_semaphore = asyncio.Semaphore(QUEUE_SUMMARY_CONCURRENCY)
+
+# Model calls in progress by case fingerprint, so overlapping refreshes await the same call
+queue_summary_inflight: Dict[str, "asyncio.Task[Optional[QueueSummary]]"] = {}
+
+def queue_case_history(case: QueueCase) -> List[dict]:
+    """The recent chat messages used both in the prompt and in the case fingerprint"""
+    return [
+        {"role": msg.get("role", "user"), "content": msg.get("content", "")}
+        for msg in case.history[-6:]
+        if isinstance(msg, dict) and msg.get("content")
+    ]
+
+def queue_case_fingerprint(case: QueueCase) -> str:
+    """Hash the parts of a case that feed the summary, so unchanged cases hit the cache"""
+    payload = json.dumps({
+        "symptoms": [str(s).strip().lower() for s in case.symptoms if str(s).strip()],
+        "duration": case.duration.strip().lower(),
+        "history": queue_case_history(case),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def summarize_queue_case(case: QueueCase) -> Tuple[QueueSummary, bool]:
+    """Run a compact pre-consultation triage for a single queued patient.
+
+    Returns the summary and whether the answer was cut off at max_tokens.
+    """
+    history_text = "\n".join(f"{msg['role']}: {msg['content']}" for msg in queue_case_history(case))
+    prompt = f"""Prepare a pre-consultation note for a doctor reviewing the patient queue.
+
+Symptoms: {', '.join(str(s) for s in case.symptoms) if case.symptoms else 'Not specified'}
+Duration: {case.duration if case.duration else 'Not specified'}
+Recent chat with AI nurse:
+{history_text if history_text else 'None'}
+
+Format your response as:
+Severity: [LOW/MEDIUM/HIGH]
+Score: [1-10]
+Summary: [One or two sentences for the doctor]"""
+
+    chat_completion = create_chat_completion(
+        "queue-summary",
+        "llama-3.3-70b-versatile",
+        256,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a clinical triage assistant writing brief notes for doctors in Indian rural healthcare."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        temperature=0.3,
+    )
+
+    ai_text = chat_completion.choices[0].message.content
+    if not ai_text:
+        raise ValueError("No response from AI model")
+
+    severity, score = extract_severity_score(ai_text)
+
+    summary, _ = extract_analysis_sections(ai_text)
+    if not summary:
+        summary = ai_text[:200] + "..." if len(ai_text) > 200 else ai_text
+
+    return QueueSummary(
+        patient_id=case.patient_id,
+        severity=severity,
+        score=score,
+        urgency_level=severity.lower(),
+        summary=summary
+    ), completion_finish_reason(chat_completion) == "length"
+
+async def compute_queue_summary(fingerprint: str, case: QueueCase) -> Optional[QueueSummary]:
+    """Summarise one case under the shared concurrency limit and cache the result"""
+    async with queue_summary_semaphore:
+        try:
+            result, truncated = await asyncio.to_thread(summarize_queue_case, case)
+        except Exception as e:
+            print(f"Error summarising queue case {case.patient_id}: {str(e)}")
+            return None
+
+    # A cut-off summary is returned once but not cached, so the next refresh retries it
+    if truncated:
+        return result
+
+    queue_summary_cache[fingerprint] = result
+    while len(queue_summary_cache) > QUEUE_SUMMARY_CACHE_SIZE:
+        queue_summary_cache.popitem(last=False)
+    return result
+
+async def get_queue_summary(fingerprint: str, case: QueueCase) -> Tuple[Optional[QueueSummary], bool]:
+    """Join the in-flight call for this fingerprint, or start one.
+
+    Returns the summary and whether this call started the model call.
+    """
+    task = queue_summary_inflight.get(fingerprint)
+    started = task is None
+    if task is None:
+        task = asyncio.create_task(compute_queue_summary(fingerprint, case))
+        queue_summary_inflight[fingerprint] = task
+        task.add_done_callback(lambda _: queue_summary_inflight.pop(fingerprint, None))
+    # Shielded so a client disconnecting does not cancel a call other requests are waiting on
+    return await asyncio.shield(task), started
+
+@app.post("/queue-summaries", response_model=QueueSummaryResponse)
+async def queue_summaries(request: QueueSummaryRequest):
+    """Summarise and rank a doctor's patient queue, recomputing only changed cases"""
+    if len(request.cases) > QUEUE_SUMMARY_MAX_CASES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many cases - at most {QUEUE_SUMMARY_MAX_CASES} per request"
+        )
+
+    try:
+        fingerprints = [queue_case_fingerprint(case) for case in request.cases]
+
+        # Identical cases in one request share a single model call
+        known: Dict[str, QueueSummary] = {}
+        pending: Dict[str, QueueCase] = {}
+        for case, fingerprint in zip(request.cases, fingerprints):
+            if fingerprint in queue_summary_cache:
+                queue_summary_cache.move_to_end(fingerprint)
+                known[fingerprint] = queue_summary_cache[fingerprint]
+            elif fingerprint not in pending:
+                pending[fingerprint] = case
+
+        results = await asyncio.gather(*(get_queue_summary(f, c) for f, c in pending.items()))
+        fresh: Dict[str, Tuple[QueueSummary, bool]] = {
+            fingerprint: (result, started)
+            for fingerprint, (result, started) in zip(pending.keys(), results)
+            if result is not None
         }
-        
-        suggested_specialists = []
-        for keyword, specialist_name in specialist_mapping.items():
-            if keyword in response_lower and specialist_name not in suggested_specialists:
-                suggested_specialists.append(specialist_name)
-        
-        # If no specialists found, infer from severity
-        if not suggested_specialists:
-            if severity == "HIGH":
-                suggested_specialists = ["Emergency Medicine", "General Physician"]
+
+        # Counted per case. Only the first case behind a model call this request
+        # started is recomputed; duplicates and results of another request's
+        # in-flight call are reused, like cache hits
+        summaries = []
+        recomputed_count = 0
+        cached_count = 0
+        failed_count = 0
+        counted = set()
+        for case, fingerprint in zip(request.cases, fingerprints):
+            if fingerprint in fresh:
+                result, started = fresh[fingerprint]
+                is_new = started and fingerprint not in counted
+                if is_new:
+                    counted.add(fingerprint)
+                    recomputed_count += 1
+                else:
+                    cached_count += 1
+                summary = result.model_copy(update={"patient_id": case.patient_id, "cached": not is_new})
+            elif fingerprint in known:
+                summary = known[fingerprint].model_copy(update={"patient_id": case.patient_id, "cached": True})
+                cached_count += 1
             else:
-                suggested_specialists = ["General Physician"]
-        
-        # Build possible conditions list with better extraction
-        possible_conditions = []
-        conditions_found = False
-        
-        for section in sections:
-            section_lower = section.lower()
-            if any(keyword in section_lower for keyword in ['differential diagnosis', 'possible condition', 'likely diagnos']):
-                lines = [line.strip() for line in section.split('\n') if line.strip()]
-                for line in lines:
-                    # Look for numbered or bulleted lists
-                    if any(char in line[:5] for char in ['1', '2', '3', '•', '-', '*']):
-                        condition_text = line.strip('1234567890.-•* ').strip()
-                        if len(condition_text) > 10:  # Meaningful condition
-                            # Try to extract probability if mentioned
-                            probability = 70  # Default
-                            if 'high' in line.lower() or 'likely' in line.lower():
-                                probability = 80
-                            elif 'possible' in line.lower() or 'consider' in line.lower():
-                                probability = 60
-                            elif 'unlikely' in line.lower() or 'less likely' in line.lower():
-                                probability = 40
-                            
-                            possible_conditions.append({
-                                "name": condition_text.split(':')[0].strip() if ':' in condition_text else condition_text[:60],
-                                "probability": probability,
-                                "description": condition_text
-                            })
-                            conditions_found = True
-                            if len(possible_conditions) >= 4:  # Max 4 conditions
-                                break
-                if conditions_found:
-                    break
-        
-        # Fallback: extract from diagnosis text
-        if not possible_conditions and diagnosis:
-            condition_lines = [line.strip() for line in diagnosis.split('.') if line.strip()]
-            for i, line in enumerate(condition_lines[:3]):
-                if len(line) > 15:
-                    possible_conditions.append({
-                        "name": line[:50],
-                        "probability": 75 - (i * 15),
-                        "description": line
-                    })
-        
-        # Ensure at least one condition
-        if not possible_conditions:
-            possible_conditions.append({
-                "name": "Requires professional evaluation",
-                "probability": 50,
-                "description": "Symptoms require in-person medical assessment for accurate diagnosis"
-            })
-        
-        # Build symptoms list from input
-        symptoms_obj_list = []
-        for symptom in symptoms_list:
-            symptoms_obj_list.append({
-                "id": symptom.lower().replace(' ', '_'),
-                "name": symptom,
-                "severity": severity.lower(),
-                "duration": duration
-            })
-        
-        return ImageAnalysisResponse(
-            image_findings=image_findings or "No image provided for analysis",
-            severity=severity,
-            diagnosis=diagnosis,
-            recommendations=recommendations[:5],  # Limit to 5
-            suggested_specialists=suggested_specialists[:3],  # Limit to 3
-            urgency_level=urgency_level,
-            possible_conditions=possible_conditions,
-            symptoms=symptoms_obj_list
+                # Model call failed - flag for manual review and retry on the next refresh
+                summary = QueueSummary(
+                    patient_id=case.patient_id,
+                    severity="UNKNOWN",
+                    score=0,
+                    urgency_level="unknown",
+                    summary="AI summary unavailable. Please review the reported symptoms.",
+                    assessed=False
+                )
+                failed_count += 1
+            summaries.append(summary)
+
+        # Unassessed cases first for manual review, then most urgent first;
+        # sort is stable so equal entries keep their queue order
+        summaries.sort(key=lambda item: (item.assessed, -item.score))
+
+        return QueueSummaryResponse(
+            summaries=summaries,
+            recomputed=recomputed_count,
+            cached=cached_count,
+            failed=failed_count
         )
-        
     except Exception as e:
-        print(f"Error in image analysis: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        print(f"Error in queue summaries: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Queue summaries failed: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
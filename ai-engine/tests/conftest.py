@@ -0,0 +1,49 @@
+import os
+import sys
+from types import SimpleNamespace
+
+# main.py builds the Groq client at import time; tests never reach the API
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import main
+
+
+def make_completion(content="", finish_reason="stop", prompt_tokens=100, completion_tokens=50):
+    """Build an object shaped like a Groq chat completion"""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(finish_reason=finish_reason, message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+    )
+
+
+class FakeCompletions:
+    """Stand-in for client.chat.completions that returns queued responses in order"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def fake_groq(monkeypatch):
+    """Replace the Groq client; call with the responses the test expects to be requested"""
+    def install(*responses):
+        completions = FakeCompletions(responses)
+        monkeypatch.setattr(main, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+        return completions
+    return install
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    """A fresh TokenBudget in place of the module-level one"""
+    fresh = main.TokenBudget()
+    monkeypatch.setattr(main, "token_budget", fresh)
+    return fresh
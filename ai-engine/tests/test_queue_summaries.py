@@ -0,0 +1,118 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from conftest import make_completion
+
+
+@pytest.fixture(autouse=True)
+def fresh_queue_state(monkeypatch):
+    monkeypatch.setattr(main, "queue_summary_cache", OrderedDict())
+    monkeypatch.setattr(main, "queue_summary_inflight", {})
+    monkeypatch.setattr(main, "queue_summary_semaphore", asyncio.Semaphore(main.QUEUE_SUMMARY_CONCURRENCY))
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    """Replace the model call with one scoring each case by its first symptom"""
+    calls = []
+
+    def summarize(case):
+        calls.append(case.patient_id)
+        if case.symptoms[0] == "fail":
+            raise ValueError("model down")
+        score = int(case.symptoms[0])
+        severity = "HIGH" if score >= 7 else "LOW"
+        summary = main.QueueSummary(
+            patient_id=case.patient_id, severity=severity, score=score,
+            urgency_level=severity.lower(), summary=f"score {score}"
+        )
+        return summary, False
+
+    monkeypatch.setattr(main, "summarize_queue_case", summarize)
+    return calls
+
+
+def case(patient_id, *symptoms, history=None):
+    return main.QueueCase(patient_id=patient_id, symptoms=list(symptoms), history=history or [])
+
+
+def run(*cases):
+    return asyncio.run(main.queue_summaries(main.QueueSummaryRequest(cases=list(cases))))
+
+
+def test_fingerprint_ignores_formatting_but_tracks_content():
+    base = case("a", "Fever", history=[{"role": "user", "content": "hot"}])
+    same = case("b", " fever ", history=[{"role": "user", "content": "hot"}, {"role": "user", "content": ""}])
+    changed = case("a", "Fever", history=[{"role": "user", "content": "hotter"}])
+
+    assert main.queue_case_fingerprint(base) == main.queue_case_fingerprint(same)
+    assert main.queue_case_fingerprint(base) != main.queue_case_fingerprint(changed)
+
+
+def test_orders_by_urgency_and_flags_failures_first(summarizer):
+    response = run(case("low", "2"), case("broken", "fail"), case("high", "9"), case("mid", "5"))
+
+    assert [s.patient_id for s in response.summaries] == ["broken", "high", "mid", "low"]
+    failed = response.summaries[0]
+    assert (failed.severity, failed.urgency_level, failed.assessed) == ("UNKNOWN", "unknown", False)
+    assert (response.recomputed, response.cached, response.failed) == (3, 0, 1)
+
+
+def test_refresh_only_recomputes_changed_cases(summarizer):
+    run(case("a", "3"), case("b", "8"))
+    response = run(case("a", "3"), case("b", "6"))
+
+    assert summarizer == ["a", "b", "b"]
+    assert (response.recomputed, response.cached, response.failed) == (1, 1, 0)
+    assert {s.patient_id: s.cached for s in response.summaries} == {"a": True, "b": False}
+
+
+def test_counts_are_per_case(summarizer):
+    response = run(case("a", "4"), case("b", "4"))
+
+    assert summarizer == ["a"]
+    assert (response.recomputed, response.cached) == (1, 1)
+    assert sorted(s.patient_id for s in response.summaries) == ["a", "b"]
+
+
+def test_failed_cases_are_retried_on_next_refresh(summarizer):
+    run(case("a", "fail"))
+    run(case("a", "fail"))
+    assert summarizer == ["a", "a"]
+
+
+def test_overlapping_requests_share_one_model_call(summarizer):
+    async def both():
+        request = main.QueueSummaryRequest(cases=[case("a", "7")])
+        return await asyncio.gather(main.queue_summaries(request), main.queue_summaries(request))
+
+    first, second = asyncio.run(both())
+
+    assert summarizer == ["a"]
+    assert sorted([(first.recomputed, first.cached), (second.recomputed, second.cached)]) == [(0, 1), (1, 0)]
+
+
+def test_rejects_too_many_cases(summarizer, monkeypatch):
+    monkeypatch.setattr(main, "QUEUE_SUMMARY_MAX_CASES", 1)
+    with pytest.raises(HTTPException) as error:
+        run(case("a", "1"), case("b", "2"))
+    assert error.value.status_code == 400
+
+
+def test_truncated_summary_is_not_cached(budget, fake_groq):
+    cut_off = "Severity: HIGH\nScore: 8\nSummary: Chest pain radiating to"
+    calls = fake_groq(
+        make_completion(cut_off, finish_reason="length"),
+        make_completion(cut_off, finish_reason="length"),
+    )
+
+    first = run(case("a", "chest pain"))
+    second = run(case("a", "chest pain"))
+
+    assert len(calls.calls) == 2
+    assert first.summaries[0].summary == "Chest pain radiating to"
+    assert (second.recomputed, second.cached) == (1, 0)
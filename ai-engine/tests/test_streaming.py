@@ -0,0 +1,163 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+ANALYSIS_TEXT = """Severity: HIGH
+Score: 9
+Summary: Crushing chest pain with sweating,
+possibly a heart attack.
+Recommended Action: Seek emergency care immediately.
+Call an ambulance if available.
+"""
+
+IMAGE_TEXT = """**VISUAL FINDINGS:**
+Red, raised plaques visible on the forearm with silvery scaling.
+Distribution is symmetric on both arms.
+
+**DIFFERENTIAL DIAGNOSIS:**
+1. Psoriasis: likely, given silvery scale
+2. Eczema: possible, itchy patches
+3. Tinea corporis: less likely
+
+**MANAGEMENT RECOMMENDATIONS:**
+- Apply a moisturiser twice daily to the plaques
+- Avoid scratching or picking at the skin
+- Consult a dermatologist within two weeks
+
+**SPECIALIST REFERRAL:**
+Dermatologist for confirmation and treatment planning.
+"""
+
+CHUNK_SIZES = [1, 3, 7, 50]
+
+
+def feed(parser, text, size):
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i:i + size])
+    return events + parser.close()
+
+
+def by_name(events):
+    grouped = {}
+    for event in events:
+        grouped.setdefault(event["event"], []).append(event["data"])
+    return grouped
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_analysis_stream_matches_final_parse(size):
+    parser = main.AnalysisStreamParser()
+    events = by_name(feed(parser, ANALYSIS_TEXT, size))
+    final = main.parse_analysis(ANALYSIS_TEXT)
+
+    assert parser.text == ANALYSIS_TEXT
+    assert (events["severity"][-1]["severity"], events["severity"][-1]["score"]) == (final.severity, final.score)
+    assert events["summary"] == [{"summary": final.summary}]
+    assert events["recommended_action"] == [{"recommended_action": final.recommended_action}]
+
+
+def test_analysis_severity_is_sent_before_the_summary():
+    parser = main.AnalysisStreamParser()
+    events = feed(parser, ANALYSIS_TEXT, 3)
+    names = [event["event"] for event in events]
+
+    assert names.index("severity") < names.index("summary")
+    assert all(event["data"]["provisional"] for event in events if event["event"] == "severity")
+
+
+def test_analysis_score_is_not_read_from_a_partial_line():
+    parser = main.AnalysisStreamParser()
+    events = parser.feed("Severity: MEDIUM\nScore: 1")
+    assert events == []
+    events = parser.feed("0\n")
+    assert events[-1]["data"]["score"] == 10
+
+
+def test_analysis_emergency_keyword_is_sent_early_then_corrected_by_score():
+    parser = main.AnalysisStreamParser()
+    early = parser.feed("This is not an emergency.")
+    assert early[0]["data"]["severity"] == "HIGH"
+
+    later = parser.feed("\nScore: 2\n")
+    assert (later[-1]["data"]["severity"], later[-1]["data"]["score"]) == ("LOW", 2)
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_image_stream_matches_final_parse(size):
+    parser = main.ImageAnalysisStreamParser()
+    events = by_name(feed(parser, IMAGE_TEXT, size))
+    final = main.parse_image_analysis(IMAGE_TEXT, ["rash"], "3 weeks")
+
+    assert events["image_findings"] == [{"image_findings": final.image_findings}]
+    assert events["diagnosis"] == [{"diagnosis": final.diagnosis}]
+    assert events["recommendations"] == [{"recommendations": final.recommendations}]
+    assert events["suggested_specialists"] == [{"suggested_specialists": final.suggested_specialists}]
+    assert "severity" not in events
+
+
+def test_image_sections_are_sent_as_they_complete():
+    parser = main.ImageAnalysisStreamParser()
+    cut = IMAGE_TEXT.index("**MANAGEMENT")
+    events = by_name(parser.feed(IMAGE_TEXT[:cut]))
+
+    assert "diagnosis" in events
+    assert "recommendations" not in events
+    assert "suggested_specialists" not in events
+
+
+def test_image_urgent_keyword_sends_high_severity_once():
+    parser = main.ImageAnalysisStreamParser()
+    events = parser.feed("This is a medical emergency") + parser.feed(" - go to emergency now\n")
+    assert [event["data"]["severity"] for event in events if event["event"] == "severity"] == ["HIGH"]
+
+
+def chunk(content, finish_reason=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)])
+
+
+def chunks_of(text, finish_reason="stop", size=4):
+    pieces = [text[i:i + size] for i in range(0, len(text), size)]
+    return [chunk(piece) for piece in pieces[:-1]] + [chunk(pieces[-1], finish_reason)]
+
+
+async def collect(response):
+    return [json.loads(line) async for line in response.body_iterator]
+
+
+def run_stream(chunks, fallback=None):
+    response = main.stream_analysis(chunks, main.AnalysisStreamParser, main.parse_analysis, fallback=fallback)
+    return asyncio.run(collect(response))
+
+
+def test_stream_ends_with_validated_result():
+    events = run_stream(chunks_of(ANALYSIS_TEXT))
+
+    assert events[-1]["event"] == "result"
+    assert events[-1]["data"] == main.parse_analysis(ANALYSIS_TEXT).model_dump()
+    assert events[-1]["truncated"] is False
+
+
+def test_stream_flags_truncated_result():
+    events = run_stream(chunks_of(ANALYSIS_TEXT, finish_reason="length"))
+    assert events[-1]["truncated"] is True
+
+
+def failing_stream(text=""):
+    if text:
+        yield chunk(text)
+    raise RuntimeError("vision stream died")
+
+
+def test_stream_falls_back_before_any_event_is_sent():
+    events = run_stream(failing_stream(), fallback=lambda: chunks_of(ANALYSIS_TEXT))
+    assert events[-1]["event"] == "result"
+
+
+def test_stream_reports_error_after_events_were_sent():
+    events = run_stream(failing_stream("Score: 9\n"), fallback=lambda: chunks_of(ANALYSIS_TEXT))
+    assert [event["event"] for event in events] == ["severity", "error"]
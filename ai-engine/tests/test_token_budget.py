@@ -0,0 +1,65 @@
+import main
+from conftest import make_completion
+
+
+def fill(budget, completion_tokens, count=20, endpoint="analyze", model="m", limit=1024):
+    for _ in range(count):
+        budget.record(endpoint, model, make_completion(completion_tokens=completion_tokens), limit)
+
+
+def test_uses_default_until_enough_samples(budget):
+    fill(budget, 100, count=budget.min_samples - 1)
+    assert budget.max_tokens("analyze", "m", 1024) == 1024
+
+
+def test_sizes_from_percentile_with_margin(budget):
+    fill(budget, 400)
+    assert budget.max_tokens("analyze", "m", 1024) == 500
+
+
+def test_never_exceeds_default_or_drops_below_floor(budget):
+    fill(budget, 2000, endpoint="big")
+    fill(budget, 10, endpoint="small")
+    assert budget.max_tokens("big", "m", 1024) == 1024
+    assert budget.max_tokens("small", "m", 1024) == int(1024 * budget.floor_fraction)
+
+
+def test_disabled_returns_default(budget, monkeypatch):
+    monkeypatch.setattr(main, "ADAPTIVE_MAX_TOKENS", False)
+    fill(budget, 400)
+    assert budget.max_tokens("analyze", "m", 1024) == 1024
+
+
+def test_truncation_grows_sizing_but_reports_observed_tokens(budget):
+    fill(budget, 400)
+    for _ in range(5):
+        budget.record("analyze", "m", make_completion(finish_reason="length", completion_tokens=500), 500)
+
+    assert budget.max_tokens("analyze", "m", 1024) == 1024
+    stats = budget.snapshot()["analyze:m"]
+    assert stats["truncated"] == 5
+    assert stats["completion_p99"] == 500
+    assert stats["max_tokens"] == 1024
+    assert stats["last_max_tokens"] == 500
+
+
+def test_truncated_answer_is_retried_at_default(budget, fake_groq):
+    fill(budget, 400)
+    calls = fake_groq(
+        make_completion("cut off", finish_reason="length", completion_tokens=500),
+        make_completion("complete answer", completion_tokens=700),
+    )
+
+    completion = main.create_chat_completion("analyze", "m", 1024, messages=[])
+
+    assert completion.choices[0].message.content == "complete answer"
+    assert [call["max_tokens"] for call in calls.calls] == [500, 1024]
+
+
+def test_truncation_at_default_is_not_retried(budget, fake_groq):
+    calls = fake_groq(make_completion("cut off", finish_reason="length", completion_tokens=1024))
+
+    completion = main.create_chat_completion("analyze", "m", 1024, messages=[])
+
+    assert completion.choices[0].message.content == "cut off"
+    assert len(calls.calls) == 1